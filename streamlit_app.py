@@ -1,9 +1,7 @@
 import numpy as np
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
 import streamlit as st
-from io import BytesIO
-from PIL import Image
+from string import Template
+import json
 import time
 
 # 设置页面配置
@@ -13,154 +11,253 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# 设置中文字体
-plt.rcParams["font.family"] = ["SimHei", "WenQuanYi Micro Hei", "Heiti TC"]
-plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
+# 转速按每秒20帧换算为浏览器端的每秒旋转角度
+SPIN_FPS = 20
+
+# 棋盘组件高度（像素）
+BOARD_HEIGHT = 600
+
+# 3D棋盘页面：由浏览器端three.js渲染并旋转，服务器只发送棋盘数据
+BOARD_TEMPLATE = Template("""
+<style>
+html, body { margin: 0; overflow: hidden; background: #f0f8ff; }
+#board-error { padding: 40px 20px; text-align: center; color: #c0392b; font-size: 18px; }
+</style>
+<div id="board"></div>
+<script type="module">
+// three.js 从 CDN 加载，失败时（离线或被屏蔽）在棋盘区域显示提示，而不是留白
+let THREE;
+try {
+  THREE = await import('https://unpkg.com/three@0.160.0/build/three.module.js');
+} catch (err) {
+  const message = document.createElement('p');
+  message.id = 'board-error';
+  message.textContent = '3D棋盘加载失败：无法从 unpkg.com 获取 three.js。请检查网络连接后刷新页面，文字提示和落子功能不受影响。';
+  document.getElementById('board').appendChild(message);
+  throw err;
+}
+
+const board = $board_json;  // board[行][列][层]：0 空，1 玩家1，2 玩家2
+const degPerSec = $deg_per_sec;
+const azim0 = $azim0;  // 时刻t0（秒）时的方位角（度）
+const t0 = $t0;
+const spinning = $spinning;
+const height = $height;
+
+const LAYER_GAP = 0.7;  // 层间距，压扁竖直方向
+const ELEVATION = 35 * Math.PI / 180;
+const DISTANCE = 10;
+const COLORS = [null, new THREE.Color('#e74c3c'), new THREE.Color('#3498db')];
+
+const renderer = new THREE.WebGLRenderer({ antialias: true });
+renderer.setPixelRatio(window.devicePixelRatio);
+renderer.setSize(window.innerWidth, height);
+renderer.setClearColor('#f0f8ff');
+document.getElementById('board').appendChild(renderer.domElement);
+
+const scene = new THREE.Scene();
+scene.add(new THREE.AmbientLight(0xffffff, 0.7));
+const light = new THREE.DirectionalLight(0xffffff, 1.5);
+light.position.set(5, 10, 7);
+scene.add(light);
+
+// (行, 列, 层) 映射到场景坐标，棋盘中心位于原点
+// 列 -> X，层 -> Y（向上），行 -> -Z，与原先右手系的棋盘布局一致
+function position(row, col, layer) {
+  return new THREE.Vector3(col - 2, layer * LAYER_GAP, 2 - row);
+}
+
+// 坐标标签：列标签沿第5行外侧，行标签沿A列外侧，层标签单独放在对角
+function label(text, pos) {
+  const canvas = document.createElement('canvas');
+  canvas.width = canvas.height = 64;
+  const ctx = canvas.getContext('2d');
+  ctx.font = 'bold 40px sans-serif';
+  ctx.fillStyle = '#333333';
+  ctx.textAlign = 'center';
+  ctx.textBaseline = 'middle';
+  ctx.fillText(text, 32, 32);
+  const sprite = new THREE.Sprite(new THREE.SpriteMaterial({ map: new THREE.CanvasTexture(canvas) }));
+  sprite.position.copy(pos);
+  sprite.scale.set(0.5, 0.5, 1);
+  scene.add(sprite);
+}
+'ABCDE'.split('').forEach((text, col) => label(text, position(5, col, 0)));
+'12345'.split('').forEach((text, row) => label(text, position(row, -1, 0)));
+'12345'.split('').forEach((text, layer) => label(text, position(-1, 5, layer)));
+label('列', position(6, 2, 0));
+label('行', position(2, -2, 0));
+label('层', position(-1, 5, 5));
+
+// 棋盘柱子：所有线段合并为一个对象
+const pillarPoints = [];
+for (let row = 0; row < 5; row++) {
+  for (let col = 0; col < 5; col++) {
+    pillarPoints.push(position(row, col, 0), position(row, col, 4));
+  }
+}
+scene.add(new THREE.LineSegments(
+  new THREE.BufferGeometry().setFromPoints(pillarPoints),
+  new THREE.LineBasicMaterial({ color: 0x95a5a6, transparent: true, opacity: 0.7 })
+));
+
+// 棋子：一个InstancedMesh绘制全部125个位置
+const stones = new THREE.InstancedMesh(
+  new THREE.SphereGeometry(0.3, 24, 16), new THREE.MeshLambertMaterial(), 125
+);
+const matrix = new THREE.Matrix4();
+let count = 0;
+board.forEach((cols, row) => cols.forEach((layers, col) => layers.forEach((value, layer) => {
+  if (!value) return;
+  matrix.setPosition(position(row, col, layer));
+  stones.setMatrixAt(count, matrix);
+  stones.setColorAt(count, COLORS[value]);
+  count++;
+})));
+stones.count = count;
+scene.add(stones);
+
+const target = new THREE.Vector3(0, 2 * LAYER_GAP, 0);
+const camera = new THREE.PerspectiveCamera(40, window.innerWidth / height, 0.1, 100);
+
+// 方位角从服务器记录的起点(azim0, t0)推算，页面重新加载后旋转保持连续
+function render() {
+  const deg = spinning ? azim0 + (Date.now() / 1000 - t0) * degPerSec : azim0;
+  const azim = deg % 360 * Math.PI / 180;
+  camera.position.set(
+    target.x + DISTANCE * Math.cos(ELEVATION) * Math.cos(azim),
+    target.y + DISTANCE * Math.sin(ELEVATION),
+    target.z - DISTANCE * Math.cos(ELEVATION) * Math.sin(azim)
+  );
+  camera.lookAt(target);
+  renderer.render(scene, camera);
+}
+
+window.addEventListener('resize', () => {
+  renderer.setSize(window.innerWidth, height);
+  camera.aspect = window.innerWidth / height;
+  camera.updateProjectionMatrix();
+  render();
+});
+
+// 游戏结束后停止旋转，只绘制一次
+if (spinning) {
+  renderer.setAnimationLoop(render);
+} else {
+  render();
+}
+</script>
+""")
+
+def _build_start_mask(direction):
+    """生成沿指定方向连续四格都不越界的起点格子掩码"""
+    dr, dc, dl = direction
+    mask = 0
+    for r, c, l in np.ndindex(5, 5, 5):
+        if 0 <= r + 3*dr < 5 and 0 <= c + 3*dc < 5 and 0 <= l + 3*dl < 5:
+            mask |= 1 << (r*25 + c*5 + l)
+    return mask
+
+@st.cache_resource
+def _precompute_win_tables(directions):
+    """预先计算每个方向的位偏移和起点掩码"""
+    # 每个方向对应的位偏移（位序号 = 行*25 + 列*5 + 层）
+    shifts = tuple(dr * 25 + dc * 5 + dl for dr, dc, dl in directions)
+    # 每个方向上可作为四连起点的格子掩码，防止移位跨越棋盘边界
+    start_masks = tuple(_build_start_mask(d) for d in directions)
+    return shifts, start_masks
+
+def _check_win_core(mask, shifts, start_masks):
+    """在位棋盘上检查是否存在四子连线（不依赖session_state）"""
+    # 每个方向：四个相邻位同时为1，且起点不越界
+    for shift, start in zip(shifts, start_masks):
+        if mask & (mask >> shift) & (mask >> 2*shift) & (mask >> 3*shift) & start:
+            return True
+    return False
 
 class GravityFourInARow3D:
+    # 输入字符到索引的查找表
+    COL_TABLE = {c: i for i, c in enumerate("ABCDE")}
+    ROW_TABLE = {c: i for i, c in enumerate("12345")}
+    
+    # 胜利检查方向
+    DIRECTIONS = (
+        (0, 1, 0), (1, 0, 0), (1, 1, 0), (1, -1, 0),
+        (0, 0, 1),
+        (1, 0, 1), (0, 1, 1), (1, 1, 1), 
+        (1, 0, -1), (0, 1, -1), (1, 1, -1),
+        (1, -1, 1), (1, -1, -1)
+    )
+    
     def __init__(self):
         # 初始化游戏状态（使用session_state确保状态持久化）
         if 'initialized' not in st.session_state:
             self.reset_game()
             st.session_state.initialized = True
         
-        # 定义胜利检查方向
-        self.directions = [
-            (0, 1, 0), (1, 0, 0), (1, 1, 0), (1, -1, 0),
-            (0, 0, 1),
-            (1, 0, 1), (0, 1, 1), (1, 1, 1), 
-            (1, 0, -1), (0, 1, -1), (1, 1, -1),
-            (1, -1, 1), (1, -1, -1)
-        ]
-
+        # 胜利检查表只与棋盘尺寸有关，由所有会话共享
+        self.shifts, self.start_masks = _precompute_win_tables(self.DIRECTIONS)
+    
     def reset_game(self):
         """重置游戏状态，开始新对局"""
-        st.session_state.board = np.zeros((5, 5, 5), dtype=int)
-        st.session_state.heights = np.zeros((5, 5), dtype=int)
+        st.session_state.board = np.zeros((5, 5, 5), dtype=np.uint8)
+        st.session_state.heights = np.zeros((5, 5), dtype=np.uint8)
+        st.session_state.bb = [0, 0]  # 玩家1、玩家2的位棋盘
+        self.anchor_spin()
         st.session_state.current_player = 1  # 玩家1先手
         st.session_state.winner = None
         st.session_state.game_over = False
         st.session_state.move_history = []
         st.session_state.message = "新游戏开始！玩家1先行，请输入位置落子"
         st.session_state.message_color = "black"
-        st.session_state.azim = 0
         st.session_state.rotation_speed = 0.5
 
     def slow_down(self):
         """降低旋转速度"""
+        self.anchor_spin()
         st.session_state.rotation_speed = max(0.1, st.session_state.rotation_speed - 0.5)
         
     def speed_up(self):
         """提高旋转速度"""
+        self.anchor_spin()
         st.session_state.rotation_speed = min(4.0, st.session_state.rotation_speed + 0.5)
     
-    def draw_pillars(self, ax):
-        """绘制棋盘柱子"""
-        for x in range(5):
-            for y in range(5):
-                ax.plot([x, x], [y, y], [0, 4], '#95a5a6', linewidth=1.5, alpha=0.7)
+    def anchor_spin(self):
+        """记录当前方位角作为新的旋转起点，在转速或旋转状态改变前调用"""
+        now = time.time()
+        if 'spin_t0' not in st.session_state:
+            st.session_state.azim0 = 0.0
+        elif not st.session_state.game_over:
+            elapsed = now - st.session_state.spin_t0
+            st.session_state.azim0 = (st.session_state.azim0
+                                      + elapsed * st.session_state.rotation_speed * SPIN_FPS) % 360
+        st.session_state.spin_t0 = now
     
     def draw_board(self):
-        """绘制3D棋盘和棋子"""
-        fig = plt.figure(figsize=(10, 8), facecolor='#f0f8ff')
-        ax = fig.add_subplot(111, projection='3d')
-        
-        # 设置视角
-        ax.view_init(elev=35, azim=st.session_state.azim)
-        
-        # 设置坐标轴标签
-        ax.set_xticks(np.arange(0, 5, 1))
-        ax.set_xticklabels(['A', 'B', 'C', 'D', 'E'])
-        ax.set_yticks(np.arange(0, 5, 1))
-        ax.set_yticklabels(['1', '2', '3', '4', '5'])
-        ax.set_zticks(np.arange(0, 5, 1))
-        ax.set_zticklabels(['1', '2', '3', '4', '5'])
-        ax.set_xlabel(' 列', labelpad=15)
-        ax.set_ylabel(' 行', labelpad=15)
-        ax.set_zlabel(' 层', labelpad=15)
-        ax.set_xlim(-0.5, 4.5)
-        ax.set_ylim(-0.5, 4.5)
-        ax.set_zlim(-0.5, 4.5)
-        ax.grid(False)
-        
-        # 调整3D坐标轴比例
-        ax.get_proj = lambda: np.dot(Axes3D.get_proj(ax), np.diag([1, 1, 0.6, 1]))
-        
-        # 调整刻度位置
-        ax.tick_params(axis='x', pad=0)
-        ax.tick_params(axis='y', pad=0)
-        ax.tick_params(axis='z', pad=5)
-        
-        # 绘制棋盘柱子
-        self.draw_pillars(ax)
-        
-        # 绘制棋子
-        x, y, z, colors = [], [], [], []
-        for i in range(5):
-            for j in range(5):
-                for k in range(st.session_state.heights[i, j]):
-                    x_val = j  # 列
-                    y_val = i  # 行
-                    z_val = k  # 层
-                    
-                    x.append(x_val)
-                    y.append(y_val)
-                    z.append(z_val)
-                    colors.append('#e74c3c' if st.session_state.board[i, j, k] == 1 else '#3498db')
-        
-        # 绘制棋子
-        if x:
-            ax.scatter(
-                x, y, z, s=250, c=colors,
-                edgecolors='black', depthshade=True, alpha=0.8
-            )
-        
-        # 如果游戏结束，显示获胜信息
-        if st.session_state.game_over:
-            if st.session_state.winner:
-                color = '#e74c3c' if st.session_state.winner == 1 else '#3498db'
-                plt.figtext(0.5, 0.95, f"玩家{st.session_state.winner}获胜！", 
-                           fontsize=20, fontweight='bold', 
-                           ha='center', va='center', color=color)
-            else:
-                plt.figtext(0.5, 0.95, "平局！", 
-                           fontsize=20, fontweight='bold', 
-                           ha='center', va='center', color='#555555')
-        
-        # 保存图形到 BytesIO
-        buf = BytesIO()
-        plt.savefig(buf, format='png', bbox_inches='tight', dpi=150)
-        buf.seek(0)
-        
-        # 转换为 PIL 图像并返回
-        img = Image.open(buf)
-        return img, buf
-    
-    def update_rotation(self):
-        """更新视角旋转"""
-        if not st.session_state.game_over:
-            st.session_state.azim = (st.session_state.azim + st.session_state.rotation_speed) % 360
+        """生成3D棋盘页面，旋转动画由浏览器端完成"""
+        return BOARD_TEMPLATE.substitute(
+            board_json=json.dumps(st.session_state.board.tolist()),
+            deg_per_sec=st.session_state.rotation_speed * SPIN_FPS,
+            azim0=st.session_state.azim0,
+            t0=st.session_state.spin_t0,
+            spinning=json.dumps(not st.session_state.game_over),
+            height=BOARD_HEIGHT
+        )
     
     def parse_input(self, pos_str):
         """将A1-E5格式转换为行列索引"""
+        pos_str = pos_str.strip().upper() if pos_str else ""
         if not pos_str:
             return None, None, "请输入位置"
             
         if len(pos_str) != 2:
             return None, None, "输入格式应为字母+数字，如A1"
         
-        col_char = pos_str[0].upper()
-        row_char = pos_str[1]
-        
-        # 转换列 (A-E -> 0-4)
-        if col_char not in "ABCDE":
-            return None, None, "列必须为A-E之间的字母"
-        col = ord(col_char) - ord('A')
-        
-        # 转换行 (1-5 -> 0-4)
-        if row_char not in "12345":
-            return None, None, "行必须为1-5之间的数字"
-        row = int(row_char) - 1 
+        # 查表转换列 (A-E -> 0-4) 和行 (1-5 -> 0-4)
+        col = self.COL_TABLE.get(pos_str[0])
+        row = self.ROW_TABLE.get(pos_str[1])
+        if col is None or row is None:
+            return None, None, "列必须为A-E之间的字母" if col is None else "行必须为1-5之间的数字"
         
         return row, col, None 
     
@@ -175,8 +272,9 @@ class GravityFourInARow3D:
             return False, "该柱子已满！"
         
         # 放置棋子
-        layer = st.session_state.heights[row][col]
-        st.session_state.board[row, col, layer] = st.session_state.current_player
+        layer = int(st.session_state.heights[row][col])
+        st.session_state.board[row, col, layer] = np.uint8(st.session_state.current_player)
+        st.session_state.bb[st.session_state.current_player - 1] |= 1 << (row*25 + col*5 + layer)
         st.session_state.heights[row][col] += 1
         
         # 记录落子历史，用于悔棋
@@ -184,12 +282,14 @@ class GravityFourInARow3D:
         
         # 检查是否获胜
         if self.check_win(row, col, layer):
+            self.anchor_spin()
             st.session_state.winner = st.session_state.current_player
             st.session_state.game_over = True
             return True, f"玩家{st.session_state.current_player} 获胜！点击[重来]开始新游戏"
         
-        # 检查是否平局
-        if np.all(st.session_state.heights == 5):
+        # 检查是否平局（落子历史长度即棋盘上的棋子数）
+        if len(st.session_state.move_history) == 125:
+            self.anchor_spin()
             st.session_state.game_over = True
             return True, "平局！棋盘已满，点击[重来]开始新游戏"
         
@@ -205,6 +305,7 @@ class GravityFourInARow3D:
             
         # 如果游戏已经结束，悔棋后重新激活游戏
         if st.session_state.game_over:
+            self.anchor_spin()
             st.session_state.game_over = False
             st.session_state.winner = None
         
@@ -214,6 +315,7 @@ class GravityFourInARow3D:
         
         # 恢复棋盘状态
         st.session_state.board[row, col, layer] = 0
+        st.session_state.bb[player - 1] &= ~(1 << (row*25 + col*5 + layer))
         st.session_state.heights[row, col] -= 1
         
         # 恢复当前玩家
@@ -223,34 +325,8 @@ class GravityFourInARow3D:
     
     def check_win(self, row, col, layer):
         """检查是否有玩家获胜"""
-        player = st.session_state.board[row, col, layer]
-        
-        # 检查每个方向
-        for dx, dy, dz in self.directions:
-            count = 1  # 当前位置已经有一个棋子
-            
-            # 正向检查
-            for i in range(1, 4):
-                r, c, l = row + i*dx, col + i*dy, layer + i*dz
-                if not (0 <= r < 5 and 0 <= c < 5 and 0 <= l < 5):
-                    break
-                if st.session_state.board[r, c, l] != player:
-                    break
-                count += 1
-            
-            # 反向检查
-            for i in range(1, 4):
-                r, c, l = row - i*dx, col - i*dy, layer - i*dz
-                if not (0 <= r < 5 and 0 <= c < 5 and 0 <= l < 5):
-                    break
-                if st.session_state.board[r, c, l] != player:
-                    break
-                count += 1
-            
-            if count >= 4:
-                return True
-        
-        return False
+        player = int(st.session_state.board[row, col, layer])
+        return _check_win_core(st.session_state.bb[player - 1], self.shifts, self.start_masks)
     
     def process_move(self, text):
         """处理移动"""
@@ -278,6 +354,9 @@ def main():
     col1, col2 = st.columns([3, 1])
     
     with col1:
+        # 创建获胜信息容器
+        banner_placeholder = st.empty()
+        
         # 创建一个容器用于动态更新棋盘
         board_placeholder = st.empty()
         
@@ -356,26 +435,23 @@ def main():
     if reset_clicked:
         game.reset_game()
     
-    # 循环更新棋盘旋转和显示
-    while True:
-        with board_placeholder:
-            # 更新旋转
-            game.update_rotation()
-            # 绘制并显示棋盘
-            board_image, buf = game.draw_board()
-            st.image(board_image, use_column_width=True)
-            buf.close()
-        
-        with status_placeholder:
-            # 显示状态信息
-            st.markdown(f"<p style='color:{st.session_state.message_color}; text-align:center; font-size:18px;'>{st.session_state.message}</p>", unsafe_allow_html=True)
-        
-        # 控制刷新速度
-        time.sleep(0.05)
-        
-        # 如果有按钮点击，退出循环以重新运行
-        if move_clicked or clear_clicked or slow_clicked or fast_clicked or undo_clicked or reset_clicked:
-            break
+    # 显示棋盘（旋转在浏览器端进行，页面内容不变时不会重新加载）
+    with board_placeholder:
+        st.iframe(game.draw_board(), height=BOARD_HEIGHT)
+    
+    # 如果游戏结束，在棋盘上方显示获胜信息
+    if st.session_state.game_over:
+        if st.session_state.winner:
+            color = '#e74c3c' if st.session_state.winner == 1 else '#3498db'
+            text = f"玩家{st.session_state.winner}获胜！"
+        else:
+            color = '#555555'
+            text = "平局！"
+        banner_placeholder.markdown(f"<h2 style='color:{color}; text-align:center;'>{text}</h2>", unsafe_allow_html=True)
+    
+    with status_placeholder:
+        # 显示状态信息
+        st.markdown(f"<p style='color:{st.session_state.message_color}; text-align:center; font-size:18px;'>{st.session_state.message}</p>", unsafe_allow_html=True)
 
 if __name__ == "__main__":
     main()